@@ -1,6 +1,8 @@
 """Utility functions used throughout 21CMMC."""
 
+import yaml
 from collections.abc import Iterable
+from functools import lru_cache
 
 
 def flatten(items):
@@ -10,3 +12,52 @@ def flatten(items):
             yield from flatten(x)
         else:
             yield x
+
+
+@lru_cache()
+def _libyaml_classes():
+    """Build libyaml-backed equivalents of the loader/dumper in py21cmfast.yaml.
+
+    These understand both arbitrary python objects and astropy quantities.
+    """
+    from astropy.io.misc import yaml as ayaml
+
+    class Loader(yaml.CLoader):
+        pass
+
+    class Dumper(yaml.CDumper):
+        pass
+
+    for base in (yaml.Loader, ayaml.AstropyLoader):
+        for k, v in base.yaml_constructors.items():
+            Loader.add_constructor(k, v)
+        for k, v in base.yaml_multi_constructors.items():
+            Loader.add_multi_constructor(k, v)
+
+    for base in (yaml.Dumper, ayaml.AstropyDumper):
+        for k, v in base.yaml_representers.items():
+            Dumper.add_representer(k, v)
+        for k, v in base.yaml_multi_representers.items():
+            Dumper.add_multi_representer(k, v)
+
+    return Loader, Dumper
+
+
+def load_yaml(stream):
+    """Load an object from a YAML stream, using libyaml if it is available."""
+    if yaml.__with_libyaml__:
+        return yaml.load(stream, Loader=_libyaml_classes()[0])
+
+    from py21cmfast import yaml as p21yaml
+
+    return p21yaml.load(stream)
+
+
+def dump_yaml(data, stream=None, **kwargs):
+    """Dump an object into a YAML stream, using libyaml if it is available."""
+    if yaml.__with_libyaml__:
+        return yaml.dump(data, stream=stream, Dumper=_libyaml_classes()[1], **kwargs)
+
+    from py21cmfast import yaml as p21yaml
+
+    return p21yaml.dump(data, stream=stream, **kwargs)
@@ -3,11 +3,12 @@
 Also enables more transparent input/output of chains.
 """
 import numpy as np
+import pickle
 from matplotlib import pyplot as plt
 from os.path import join
 from pathlib import Path
-from py21cmfast import yaml
 
+from ._utils import load_yaml
 from .cosmoHammer import CosmoHammerSampler, HDFStorage
 
 
@@ -67,8 +68,14 @@ def load_primitive_chain(modelname, direc="."):
     chain : :class:`~py21cmmc.cosmoHammer.LikelihoodComputationChain`
         The fully set-up chain, with no computed samples.
     """
-    with open(join(direc, modelname + ".LCC.yml")) as f:
-        chain = yaml.load(f)
+    prefix = join(direc, modelname)
+    try:
+        with open(prefix + ".LCC.pkl", "rb") as f:
+            chain = pickle.load(f)
+    except FileNotFoundError:
+        # chains written by older versions are stored in full in the YAML file.
+        with open(prefix + ".LCC.yml") as f:
+            chain = load_yaml(f)
 
     chain.setup()
     return chain
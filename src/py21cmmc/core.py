@@ -413,10 +413,10 @@ class CoreCoevalModule(CoreBase):
     def build_model_data(self, ctx):
         """Compute all data defined by this core and add it to the context."""
         # Update parameters
-        logger.debug(f"Updating parameters: {ctx.getParams()}")
+        logger.debug("Updating parameters: %s", ctx.getParams())
         astro_params, cosmo_params = self._update_params(ctx.getParams())
-        logger.debug(f"AstroParams: {astro_params}")
-        logger.debug(f"CosmoParams: {cosmo_params}")
+        logger.debug("AstroParams: %s", astro_params)
+        logger.debug("CosmoParams: %s", cosmo_params)
 
         # Call C-code
         coeval = p21.run_coeval(
@@ -432,7 +432,7 @@ class CoreCoevalModule(CoreBase):
             **self.global_params,
         )
 
-        logger.debug(f"Adding {self.ctx_variables} to context data")
+        logger.debug("Adding %s to context data", self.ctx_variables)
         for key in self.ctx_variables:
             try:
                 ctx.add(key, [getattr(c, key) for c in coeval])
@@ -674,7 +674,7 @@ class CoreLuminosityFunction(CoreCoevalModule):
                 ap.append(apars)
             astro_params = ap
             astro_params = np.array(astro_params, dtype=object)
-        logger.debug(f"AstroParams: {astro_params}")
+        logger.debug("AstroParams: %s", astro_params)
         # Call C-code
         Muv, mhalo, lfunc = self.run(astro_params, cosmo_params, ctx)
         ctx.add(
@@ -1301,7 +1301,7 @@ class Core21cmEMU(CoreBase):
     def build_model_data(self, ctx):
         """Compute all data defined by this core and add it to the context."""
         # Update parameters
-        logger.debug(f"Updating parameters: {ctx.getParams()}")
+        logger.debug("Updating parameters: %s", ctx.getParams())
         astro_params = ctx.getParams()
         if isinstance(astro_params, dict):
             values = astro_params.values()
@@ -1329,7 +1329,7 @@ class Core21cmEMU(CoreBase):
             for t in zip(*values):
                 ap.append(dict(zip(keys, t)))
             astro_params = np.array(ap, dtype=object)
-        logger.debug(f"AstroParams: {astro_params}")
+        logger.debug("AstroParams: %s", astro_params)
 
         theta, outputs, errors = self.emulator.predict(astro_params=astro_params)
         if self.io_options["cache_dir"] is not None:
@@ -1344,7 +1344,7 @@ class Core21cmEMU(CoreBase):
                 theta=theta,
                 store=self.io_options["store"],
             )
-        logger.debug(f"Adding {self.ctx_variables} to context data")
+        logger.debug("Adding %s to context data", self.ctx_variables)
         for key in self.ctx_variables:
             try:
                 ctx.add(key + self.name, getattr(outputs, key))
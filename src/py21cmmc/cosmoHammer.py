@@ -20,13 +20,37 @@ logger = getLogger()
 
 
 class HDFStorage:
-    """A HDF Storage utility, based on the HDFBackend from emcee v3.0.0."""
+    """A HDF Storage utility, based on the HDFBackend from emcee v3.0.0.
+
+    Parameters
+    ----------
+    filename : str
+        The HDF5 file to write to.
+    name : str
+        The name of the group in the file holding this chain.
+    chunk_rows : int, optional
+        Number of iterations stored per HDF5 chunk of each dataset. By default, h5py
+        chooses the chunk shape.
+    compression : str, optional
+        Compression filter applied to each dataset (eg. "lzf" or "gzip").
+    shuffle : bool, optional
+        Whether to apply the byte-shuffle filter before compressing.
+    """
+
+    #: Size (in bytes) and number of slots of the raw-data chunk cache of open files.
+    chunk_cache_bytes = 1 << 25
+    chunk_cache_slots = 10007
 
-    def __init__(self, filename, name):
+    def __init__(
+        self, filename, name, chunk_rows=None, compression=None, shuffle=False
+    ):
         if h5py is None:
             raise ImportError("you must install 'h5py' to use the HDFBackend")
         self.filename = filename
         self.name = name
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.shuffle = shuffle
 
     @property
     def initialized(self):
@@ -41,7 +65,27 @@ class HDFStorage:
 
     def open(self, mode="r"):  # noqa
         """Open the backend file."""
-        return h5py.File(self.filename, mode)
+        return h5py.File(
+            self.filename,
+            mode,
+            rdcc_nbytes=self.chunk_cache_bytes,
+            rdcc_nslots=self.chunk_cache_slots,
+        )
+
+    def _dataset_options(self, dtype, *shape):
+        """Chunking and filter options for a dataset growing along its first axis.
+
+        Chunks hold up to ``chunk_rows`` iterations, but never more than fit in the
+        chunk cache, so that writing an iteration doesn't re-read and re-compress the
+        whole chunk. If a single iteration is larger than the cache (eg. large blobs),
+        h5py chooses the chunk shape.
+        """
+        options = {"compression": self.compression, "shuffle": self.shuffle}
+        if self.chunk_rows:
+            row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape))
+            rows = min(self.chunk_rows, self.chunk_cache_bytes // row_bytes)
+            options["chunks"] = (rows,) + shape if rows else True
+        return options
 
     def reset(self, nwalkers, params):
         """Clear the state of the chain and empty the backend.
@@ -78,16 +122,25 @@ class HDFStorage:
                 ),
             )
             g.create_dataset(
-                "accepted", (0, nwalkers), maxshape=(None, nwalkers), dtype=int
+                "accepted",
+                (0, nwalkers),
+                maxshape=(None, nwalkers),
+                dtype=int,
+                **self._dataset_options(int, nwalkers),
             )
             g.create_dataset(
                 "chain",
                 (0, nwalkers, ndim),
                 maxshape=(None, nwalkers, ndim),
                 dtype=np.float64,
+                **self._dataset_options(np.float64, nwalkers, ndim),
             )
             g.create_dataset(
-                "log_prob", (0, nwalkers), maxshape=(None, nwalkers), dtype=np.float64
+                "log_prob",
+                (0, nwalkers),
+                maxshape=(None, nwalkers),
+                dtype=np.float64,
+                **self._dataset_options(np.float64, nwalkers),
             )
 
             g.create_dataset(
@@ -95,12 +148,14 @@ class HDFStorage:
                 (0, nwalkers, ndim),
                 maxshape=(None, nwalkers, ndim),
                 dtype=np.float64,
+                **self._dataset_options(np.float64, nwalkers, ndim),
             )
             g.create_dataset(
                 "trial_log_prob",
                 (0, nwalkers),
                 maxshape=(None, nwalkers),
                 dtype=np.float64,
+                **self._dataset_options(np.float64, nwalkers),
             )
 
     @property
@@ -242,6 +297,7 @@ class HDFStorage:
                         (ntot, nwalkers),
                         maxshape=(None, nwalkers),
                         dtype=blobs_dtype,
+                        **self._dataset_options(blobs_dtype, nwalkers),
                     )
                 else:
                     g["blobs"].resize(ntot, axis=0)
@@ -470,13 +526,19 @@ class HDFStorage:
 
 
 class HDFStorageUtil:
-    """Storage class for MCMC runs."""
+    """Storage class for MCMC runs.
+
+    Any extra keyword arguments (eg. ``chunk_rows`` and ``compression``) are passed
+    through to both underlying :class:`HDFStorage` objects.
+    """
 
-    def __init__(self, file_prefix, chain_number=0):
+    def __init__(self, file_prefix, chain_number=0, **storage_options):
         self.file_prefix = file_prefix
-        self.burnin_storage = HDFStorage(file_prefix + ".h5", name="burnin")
+        self.burnin_storage = HDFStorage(
+            file_prefix + ".h5", name="burnin", **storage_options
+        )
         self.sample_storage = HDFStorage(
-            file_prefix + ".h5", name="sample_%s" % chain_number
+            file_prefix + ".h5", name="sample_%s" % chain_number, **storage_options
         )
 
     def reset(self, nwalkers, params, burnin=True, samples=True):
@@ -515,6 +577,22 @@ class Params(_util.Params):
         """Iterate through the params like a dict."""
         yield from zip(self.keys, self.values)
 
+    @classmethod
+    def from_vector(cls, keys, values):
+        """Create an instance from a sequence of keys and a vector of their values.
+
+        This is a fast alternative to ``Params(*zip(keys, values))`` which does not
+        check the keys for duplicates, so ``keys`` should come from an existing
+        instance. As with ``zip``, the longer of the two inputs is truncated.
+        """
+        self = cls.__new__(cls)
+        values = np.asarray(values)
+        n = min(len(keys), len(values))
+        self._keys = list(keys[:n])
+        self._values = values[:n].copy()
+        self.__dict__.update(zip(self._keys, self._values))
+        return self
+
     def __eq__(self, other):
         """Test equality of two instances."""
         if self.__class__.__name__ != other.__class__.__name__:
@@ -548,7 +626,7 @@ class LikelihoodComputationChain(_Chain):
 
         Parameters
         ----------
-        p : list or Params object, optional
+        p : list, array or Params object, optional
             The parameters at which to evaluate the model data.
 
         Returns
@@ -641,7 +719,7 @@ class LikelihoodComputationChain(_Chain):
         if not self._setup:
             self.setup()
 
-        logger.debug(f"Invoking {coremodule.__class__.__name__}...")
+        logger.debug("Invoking %s...", coremodule.__class__.__name__)
         coremodule(ctx)
         logger.debug("... finished.")
 
@@ -655,18 +733,18 @@ class LikelihoodComputationChain(_Chain):
         if not self._setup:
             self.setup()
 
-        logger.debug(f"Reducing data for {module.__class__.__name__}...")
+        logger.debug("Reducing data for %s...", module.__class__.__name__)
         model = module.reduce_data(ctx)
         logger.debug("... done reducing data")
 
         if hasattr(module, "store"):
-            logger.debug(f"Storing blobs for {module.__class__.__name__}...")
+            logger.debug("Storing blobs for %s...", module.__class__.__name__)
             module.store(model, ctx.getData())
             logger.debug("... done storing blobs.")
 
-        logger.debug(f"Computing Likelihood for {module.__class__.__name__}...")
+        logger.debug("Computing Likelihood for %s...", module.__class__.__name__)
         lnl = module.computeLikelihood(model)
-        logger.debug(f"... done computing likelihood (lnl = {lnl}")
+        logger.debug("... done computing likelihood (lnl = %s)", lnl)
         return lnl
 
     def __call__(self, p):
@@ -685,6 +763,15 @@ class LikelihoodComputationChain(_Chain):
         if p is None:
             p = {}
 
+        if self.params is not None and isinstance(p, (_util.Params, np.ndarray)):
+            # the common case when sampling, so skip re-building from (key, value) pairs
+            return ChainContext(
+                self,
+                Params.from_vector(
+                    self.params.keys, p.values if isinstance(p, _util.Params) else p
+                ),
+            )
+
         try:
             p = Params(*zip(self.params.keys, p))
         except Exception:
@@ -602,7 +602,7 @@ class Likelihood1DPowerCoeval(LikelihoodBaseFile):
                     (m["delta"][mask] - pd(m["k"][mask])) ** 2
                     / (moduncert**2 + noise**2)
                 )
-        logger.debug(f"Likelihood computed: {lnl}")
+        logger.debug("Likelihood computed: %s", lnl)
 
         return lnl
 
@@ -1218,7 +1218,7 @@ class LikelihoodPlanck(LikelihoodBase):
                 + (tau_sigma_u - tau_sigma_l) * (model["tau"] - self.tau_mean)
             )
         )
-        logger.debug(f"Planck Likelihood computed: {lnl}")
+        logger.debug("Planck Likelihood computed: %s", lnl)
         return lnl
 
     @property
@@ -1461,7 +1461,7 @@ class LikelihoodNeutralFraction(LikelihoodBase):
                 else:
                     lnprob[i] += self.lnprob(model_spline(z), data, sigma_t)
 
-        logger.debug(f"Neutral fraction Likelihood computed: {lnprob}")
+        logger.debug("Neutral fraction Likelihood computed: %s", lnprob)
         return lnprob
 
     def lnprob(self, model, data, sigma):
@@ -1838,7 +1838,7 @@ class LikelihoodLuminosityFunction(LikelihoodBaseFile):
                         / total_err
                     )[data["Muv"][i] > self.mag_brightest]
                 )
-        logger.debug(f"UV LF Likelihood computed: {lnl}")
+        logger.debug("UV LF Likelihood computed: %s", lnl)
         return lnl
 
     def define_noise(self, ctx, model):
@@ -2331,7 +2331,7 @@ class Likelihood1DPowerLightconeUpper(Likelihood1DPowerLightcone):
                             lnl=np.nansum(np.log(likelihood))
                         )
                     )
-        logger.debug(f"Total HERA PS upper Likelihood computed: {lnl}")
+        logger.debug("Total HERA PS upper Likelihood computed: %s", lnl)
         return lnl
 
     @cached_property
@@ -1,13 +1,17 @@
 """High-level functions for running MCMC chains."""
+import hashlib
+import inspect
 import logging
+import multiprocessing
 import numpy as np
-import scipy.stats as stats
-from cmath import log
+import pickle
 from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from os import mkdir, path
-from py21cmfast import yaml
 from py21cmfast._utils import ParameterError
+from scipy.special import ndtr, ndtri
 
+from ._utils import dump_yaml, load_yaml
 from .cosmoHammer import (
     CosmoHammerSampler,
     HDFStorageUtil,
@@ -17,6 +21,295 @@ from .cosmoHammer import (
 
 logger = logging.getLogger("21cmFAST")
 
+# Options in ``mcmc_options`` that are specific to each of the alternative samplers.
+_MULTINEST_KEYS = frozenset(
+    (
+        "n_live_points",
+        "importance_nested_sampling",
+        "sampling_efficiency",
+        "evidence_tolerance",
+        "max_iter",
+        "multimodal",
+        "write_output",
+    )
+)
+_ZEUS_KEYS = frozenset(
+    (
+        "ndim",
+        "nwalkers",
+        "nsteps",
+        "seed",
+        "tolerance",
+        "patience",
+        "maxsteps",
+        "mu",
+        "maxiter",
+        "blobs_dtype",
+        "verbose",
+        "check_walkers",
+        "shuffle_ensemble",
+        "light_mode",
+        "likelihood_cache_size",
+    )
+)
+_ULTRANEST_KEYS = frozenset(
+    (
+        "log_dir",
+        "resume",
+        "run_num",
+        "num_test_samples",
+        "vectorized",
+        "draw_multiple",
+        "ndraw_min",
+        "ndraw_max",
+        "num_bootstraps",
+        "warmstart_max_tau",
+        "update_interval_volume_fraction",
+        "log_interval",
+        "show_status",
+        "dlogz",
+        "dKL",
+        "frac_remain",
+        "Lepsilon",
+        "min_ess",
+        "max_iters",
+        "max_ncalls",
+        "max_num_improvement_loops",
+        "min_num_live_points",
+        "cluster_num_live_points",
+        "insertion_test_zscore_threshold",
+        "insertion_test_window",
+        "region_class",
+    )
+)
+
+
+def _to_physical(cube, lower, width):
+    """Map a point in the unit cube onto the parameter ranges, in-place."""
+    np.multiply(cube, width, out=cube)
+    np.add(cube, lower, out=cube)
+
+
+def _out_of_bounds(points, lower, upper):
+    """Whether each row of a 2D array of points lies outside the bounds."""
+    return np.any((points > upper) | (points < lower), axis=1)
+
+
+def _to_physical_loop(cube, lower, width):
+    """Loop equivalent of :func:`_to_physical`, to be compiled with numba."""
+    for i in range(cube.shape[0]):
+        cube[i] = lower[i] + cube[i] * width[i]
+
+
+def _out_of_bounds_loop(points, lower, upper):
+    """Loop equivalent of :func:`_out_of_bounds`, to be compiled with numba."""
+    out = np.zeros(points.shape[0], dtype=np.bool_)
+    for i in range(points.shape[0]):
+        for j in range(points.shape[1]):
+            if points[i, j] < lower[j] or points[i, j] > upper[j]:
+                out[i] = True
+                break
+    return out
+
+
+@lru_cache()
+def _prior_kernels():
+    """Get the unit-cube transform and bounds-check functions.
+
+    These are called once per proposal, so for the few parameters typically being
+    sampled, a loop compiled with numba (if it is installed) beats the fixed overhead
+    of the NumPy ufunc calls.
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return _to_physical, _out_of_bounds
+
+    return njit(cache=True)(_to_physical_loop), njit(cache=True)(_out_of_bounds_loop)
+
+
+def _truncated_normal(a, b, size, rng):
+    """Draw standard normal variates truncated to ``[a, b]`` by inverting the CDF."""
+    # Intervals in the upper tail are mirrored into the lower one, where the CDF
+    # doesn't lose precision by approaching one.
+    flip = a > 0
+    lower = ndtr(np.where(flip, -b, a))
+    upper = ndtr(np.where(flip, -a, b))
+    z = ndtri(lower + rng.random(size) * (upper - lower))
+    return np.where(flip, -z, z)
+
+
+def _worker_init(log_level=None):
+    """Configure logging in a freshly started worker of the default pool."""
+    # Import 21cmFAST up-front, rather than when the first chain is unpickled.
+    import py21cmfast  # noqa: F401
+
+    if log_level is not None:
+        logging.getLogger("21CMMC").setLevel(log_level)
+
+
+# The process pool started by run_mcmc when no pool is given, kept alive so that later
+# calls (eg. continuing a chain) don't pay the start-up cost of the workers again.
+_default_pool = None
+_default_pool_config = None
+
+
+def _get_default_pool(max_workers, log_level=None, start_method=None):
+    """Get the default process pool, re-using the previous one if it is compatible.
+
+    ``start_method`` is passed to :func:`multiprocessing.get_context`, so by default
+    the workers are started with the platform's default method.
+    """
+    global _default_pool, _default_pool_config
+
+    config = (max_workers, log_level, start_method)
+    if _default_pool is not None and (
+        _default_pool_config != config or getattr(_default_pool, "_broken", False)
+    ):
+        _shutdown_default_pool()
+
+    if _default_pool is None:
+        _default_pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_worker_init,
+            initargs=(log_level,),
+        )
+        _default_pool_config = config
+
+    return _default_pool
+
+
+def _shutdown_default_pool():
+    """Shut down the default process pool, without waiting on its workers."""
+    global _default_pool, _default_pool_config
+
+    if _default_pool is not None:
+        _default_pool.shutdown(wait=False)
+    _default_pool = None
+    _default_pool_config = None
+
+
+class _BatchedPool:
+    """Wrap a pool so that each call to ``map`` sends items to workers in chunks."""
+
+    def __init__(self, pool, chunksize):
+        self._pool = pool
+        self._chunksize = chunksize
+
+    def map(self, fn, iterable):
+        """Map ``fn`` over ``iterable`` with the wrapped pool, in chunks."""
+        return self._pool.map(fn, iterable, chunksize=self._chunksize)
+
+
+def _batched_pool(pool, nitems):
+    """Batch the ``map`` of a pool over ``nitems`` items to ~4 chunks per worker.
+
+    The number of workers is read from the private ``_max_workers`` (executors from
+    :mod:`concurrent.futures`) or ``_processes`` (pools from :mod:`multiprocessing`)
+    attribute, so thread pools are batched too, and the mapped function may be called
+    from several threads at once. Pools whose ``map`` takes no ``chunksize``, or whose
+    size is unknown, are returned unchanged.
+    """
+    nworkers = getattr(pool, "_max_workers", None) or getattr(pool, "_processes", None)
+    try:
+        takes_chunksize = "chunksize" in inspect.signature(pool.map).parameters
+    except (TypeError, ValueError):
+        takes_chunksize = False
+
+    if not nworkers or not takes_chunksize:
+        return pool
+    return _BatchedPool(pool, max(1, nitems // (4 * nworkers)))
+
+
+class _ChainLikelihood:
+    """The log-likelihood of a chain at a vector of parameter values.
+
+    Unlike a closure, this can be pickled to be mapped over a process pool.
+    """
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    def __call__(self, p):
+        """Evaluate the log-likelihood, which is -inf for invalid parameters."""
+        try:
+            return self.chain.computeLikelihoods(self.chain.build_model_data(p))
+        except ParameterError:
+            return -np.inf
+
+
+class _ZeusPosterior:
+    """The log-posterior of a whole ensemble of zeus walkers at once.
+
+    Walkers outside the prior bounds are rejected without evaluating the likelihood,
+    and the others are mapped over ``distribute``. Up to ``cache_size`` recent
+    likelihoods are remembered (keyed on the exact parameter values), so that repeated
+    proposals don't re-run the forward model. The cache lives in the calling process,
+    so it works with any kind of pool, and only the points missing from it are
+    distributed. Cores that draw a new seed on every evaluation are not deterministic,
+    so nothing is cached for them.
+    """
+
+    def __init__(self, chain, lower, upper, distribute=map, cache_size=0):
+        self.likelihood = _ChainLikelihood(chain)
+        self.lower = np.ascontiguousarray(lower, dtype=np.float64)
+        self.upper = np.ascontiguousarray(upper, dtype=np.float64)
+        self.distribute = distribute
+
+        if any(
+            getattr(cm, "change_seed_every_iter", False)
+            for cm in chain.getCoreModules()
+        ):
+            cache_size = 0
+        self.cache_size = cache_size
+        self._cache = {}
+        _, self._out_of_bounds = _prior_kernels()
+
+    def __call__(self, P):
+        """Evaluate the log-posterior of each row of a (nwalkers, ndim) array."""
+        P = np.ascontiguousarray(P, dtype=np.float64)
+        log_prob = np.full(P.shape[0], -np.inf)
+        rows = np.flatnonzero(~self._out_of_bounds(P, self.lower, self.upper))
+
+        if not self.cache_size:
+            log_prob[rows] = list(self.distribute(self.likelihood, P[rows]))
+            return log_prob
+
+        # rows of points not yet cached, grouped so that repeats are evaluated once.
+        missing = {}
+        for i in rows:
+            key = P[i].tobytes()
+            if key in self._cache:
+                log_prob[i] = self._cache[key]
+            else:
+                missing.setdefault(key, []).append(i)
+
+        todo = P[[idx[0] for idx in missing.values()]]
+        for (key, idx), lnl in zip(
+            missing.items(), self.distribute(self.likelihood, todo)
+        ):
+            log_prob[idx] = lnl
+            if len(self._cache) >= self.cache_size:
+                # evict the oldest entry
+                del self._cache[next(iter(self._cache))]
+            self._cache[key] = lnl
+
+        return log_prob
+
+
+def _chain_metadata(chain):
+    """A human-readable summary of the parameters sampled by a chain."""
+    return {k: [float(x) for x in v] for k, v in chain.params.items()}
+
+
+def _chain_fingerprint(chain):
+    """SHA-256 digest of the pickled chain, or None if it cannot be pickled."""
+    try:
+        return hashlib.sha256(pickle.dumps(chain, protocol=5)).hexdigest()
+    except Exception:
+        return None
+
 
 def build_computation_chain(core_modules, likelihood_modules, params=None, setup=True):
     """
@@ -69,6 +362,9 @@ def run_mcmc(
     use_multinest=False,
     use_zeus=False,
     use_ultranest=False,
+    storage_chunk_rows=256,
+    storage_compression="lzf",
+    start_method=None,
     **mcmc_options,
 ) -> CosmoHammerSampler:
     r"""Run an MCMC chain.
@@ -86,7 +382,8 @@ def run_mcmc(
         name of the parameter, and its value is an iterable `(val, min, max, width)`,
         with `val` the initial guess, `min` and `max` the hard boundaries on the
         parameter's value, and `width` determining the size of the initial ball of
-        walker positions for the parameter.
+        walker positions for the parameter. Proposals outside the hard boundaries are
+        given zero posterior probability without evaluating the likelihood.
     datadir : str, optional
         Directory to which MCMC info will be written (eg. logs and chain files)
     model_name : str, optional
@@ -103,11 +400,25 @@ def run_mcmc(
     log_level_21CMMC : (int or str, optional)
         The logging level of the cosmoHammer log file.
     use_multinest : bool, optional
-        If true, use the MultiNest sampler instead.
+        If true, use the MultiNest sampler instead. MultiNest is run without MPI, and
+        calls the likelihood one point at a time from this process, so ``pool`` and
+        ``threadCount`` have no effect on it.
     use_zeus : bool, optional
         If true, use the zeus sampler instead.
     use_ultranest : bool, optional
         If true, use the UltraNest sampler instead.
+    storage_chunk_rows : int, optional
+        Number of iterations held in each HDF5 chunk of the chain file written by the
+        default sampler.
+    storage_compression : str, optional
+        Compression filter for the datasets of the chain file (shuffled before
+        compression). Set to None to write uncompressed datasets.
+    start_method : str, optional
+        The :mod:`multiprocessing` start method ("fork", "spawn" or "forkserver") of
+        the process pool created when no ``pool`` is given to the default sampler.
+        By default, the platform's default method is used. Workers started with
+        "spawn" or "forkserver" must be able to import every core and likelihood
+        class, so these can't be defined in ``__main__`` (eg. a notebook).
 
     Other Parameters
     ----------------
@@ -116,7 +427,10 @@ def run_mcmc(
         :class:`~py21cmmc.cosmoHammer.CosmoHammerSampler`. These include important
         options such as ``walkersRatio`` (the number of walkers is
         ``walkersRatio*nparams``), ``sampleIterations``, ``burninIterations``, ``pool``,
-        ``log_level_stream`` and ``threadCount``.
+        ``log_level_stream`` and ``threadCount``. If no ``pool`` is given, a process
+        pool of ``threadCount`` workers is started (see ``start_method``). This pool
+        is kept alive and re-used by subsequent calls with the same ``threadCount``,
+        ``log_level_21CMMC`` and ``start_method``.
         If use_multinest, parameters required by MultiNest as shown below should be
         provided here.
     n_live_points : int, optional
@@ -143,6 +457,9 @@ def run_mcmc(
         number of dimensions to sample over (Default is number of supplied parameters)
     nwalkers : int
         number of walkers (Default is 2*ndim)
+    seed : int, optional
+        Seed for the random generator used to draw the initial walker positions
+        (Default is None, i.e. not reproducible).
     tolerance : float, optional
         Tuning optimization tolerance (Default is 0.05).
     patience : int, optional
@@ -155,8 +472,8 @@ def run_mcmc(
         Number of maximum Expansions/Contractions (Default is 10^4).
     pool : bool, optional
         External pool of workers to distribute workload to multiple CPUs (default is None).
-    vectorize : bool, optional
-        If true (default is False), logprob_fn receives not just one point but an array of points, and returns an array of log-probabilities.
+        The ensemble is always evaluated in vectorized form, and the in-bounds walkers
+        of each step are mapped over this pool.
     blobs_dtype : list, optional
         List containing names and dtypes of blobs metadata e.g. [("log_prior", float), ("mean", float)].
         It's useful when you want to save multiple species of metadata. Default is None.
@@ -169,6 +486,10 @@ def run_mcmc(
     light_mode : bool, optional
         If True (default is False) then no expansions are performed after the tuning phase.
         This can significantly reduce the number of log likelihood evaluations but works best in target distributions that are apprroximately Gaussian.
+    likelihood_cache_size : int, optional
+        Number of recent likelihood evaluations remembered, so that proposals repeating
+        an already-evaluated point skip the forward model (Default is 4096; 0 disables).
+        Ignored if any core changes its seed on every iteration.
 
         If use_ultranest, parameters required by UltraNest as shown below should be
         provided here.
@@ -271,15 +592,15 @@ def run_mcmc(
         raise ValueError("You cannot use more than one sampler at the time!")
 
     if use_multinest:
-        n_live_points = mcmc_options.get("n_live_points", 100)
-        importance_nested_sampling = mcmc_options.get(
+        n_live_points = mcmc_options.pop("n_live_points", 100)
+        importance_nested_sampling = mcmc_options.pop(
             "importance_nested_sampling", True
         )
-        sampling_efficiency = mcmc_options.get("sampling_efficiency", 0.8)
-        evidence_tolerance = mcmc_options.get("evidence_tolerance", 0.5)
-        max_iter = mcmc_options.get("max_iter", 50)
-        multimodal = mcmc_options.get("multimodal", True)
-        write_output = mcmc_options.get("write_output", True)
+        sampling_efficiency = mcmc_options.pop("sampling_efficiency", 0.8)
+        evidence_tolerance = mcmc_options.pop("evidence_tolerance", 0.5)
+        max_iter = mcmc_options.pop("max_iter", 50)
+        multimodal = mcmc_options.pop("multimodal", True)
+        write_output = mcmc_options.pop("write_output", True)
         datadir = datadir + "/MultiNest/"
         try:
             from pymultinest import run
@@ -291,40 +612,38 @@ def run_mcmc(
         pass
 
     if use_zeus:
-        ndim = mcmc_options.get(
+        ndim = mcmc_options.pop(
             "ndim", 2
         )  # Number of parameters/dimensions (e.g. m and c)
-        nwalkers = mcmc_options.get(
+        nwalkers = mcmc_options.pop(
             "nwalkers", 10
         )  # Number of walkers to use. It should be at least twice the number of dimensions.
-        nsteps = mcmc_options.get("nsteps", 100)  # Number of steps/iterations.
+        nsteps = mcmc_options.pop("nsteps", 100)  # Number of steps/iterations.
         # set up parameters
         params = Params(*[(k, v) for k, v in params.items()])
-        # initial positions of the walkers
-        start = np.asarray(
-            [
-                stats.truncnorm.rvs(
-                    (params[i][1] - params[i][0]) / params[i][-1],
-                    (params[i][2] - params[i][0]) / params[i][-1],
-                    loc=params[i][0],
-                    scale=params[i][-1],
-                    size=nwalkers,
-                )
-                for i in range(ndim)
-            ]
-        ).T
-        tolerance = mcmc_options.get("tolerance", 0.05)
-        patience = mcmc_options.get("patience", 5)
-        maxsteps = mcmc_options.get("maxsteps", 1e4)
-        mu = mcmc_options.get("mu", 1.0)
-        maxiter = mcmc_options.get("maxiter", 1e4)
-        pool = mcmc_options.get("pool", None)
-        vectorize = mcmc_options.get("vectorize", False)
-        blobs_dtype = mcmc_options.get("blobs_dtype", None)
-        verbose = mcmc_options.get("vectorize", True)
-        check_walkers = mcmc_options.get("check_walkers", True)
-        shuffle_ensemble = mcmc_options.get("shuffle_ensemble", True)
-        light_mode = mcmc_options.get("light_mode", False)
+        seed = mcmc_options.pop("seed", None)
+        # initial positions of the walkers, drawn for all parameters at once from
+        # truncated normals broadcast over the (ndim,) parameter arrays.
+        guess = params[:ndim, 0]
+        width = params[:ndim, -1]
+        start = guess + width * _truncated_normal(
+            (params[:ndim, 1] - guess) / width,
+            (params[:ndim, 2] - guess) / width,
+            size=(nwalkers, ndim),
+            rng=np.random.default_rng(seed),
+        )
+        tolerance = mcmc_options.pop("tolerance", 0.05)
+        patience = mcmc_options.pop("patience", 5)
+        maxsteps = mcmc_options.pop("maxsteps", 1e4)
+        mu = mcmc_options.pop("mu", 1.0)
+        maxiter = mcmc_options.pop("maxiter", 1e4)
+        pool = mcmc_options.pop("pool", None)
+        blobs_dtype = mcmc_options.pop("blobs_dtype", None)
+        verbose = mcmc_options.pop("verbose", True)
+        check_walkers = mcmc_options.pop("check_walkers", True)
+        shuffle_ensemble = mcmc_options.pop("shuffle_ensemble", True)
+        light_mode = mcmc_options.pop("light_mode", False)
+        likelihood_cache_size = mcmc_options.pop("likelihood_cache_size", 4096)
 
         try:
             import zeus
@@ -337,37 +656,37 @@ def run_mcmc(
         except ImportError:
             raise ImportError("You need to install ultranest to use this function!")
 
-        log_dir = mcmc_options.get("log_dir", None)
-        resume = mcmc_options.get("resume", "subfolder")
-        run_num = mcmc_options.get("run_num", None)
-        num_test_samples = mcmc_options.get("num_test_samples", 2)
-        vectorized = mcmc_options.get("vectorized", False)
-        draw_multiple = mcmc_options.get("draw_multiple", True)
-        ndraw_min = mcmc_options.get("ndraw_min", 128)
-        ndraw_max = mcmc_options.get("ndraw_max", 65536)
-        num_bootstraps = mcmc_options.get("num_bootstraps", 30)
-        warmstart_max_tau = mcmc_options.get("warmstart_max_tau", -1)
-
-        update_interval_volume_fraction = mcmc_options.get(
+        log_dir = mcmc_options.pop("log_dir", None)
+        resume = mcmc_options.pop("resume", "subfolder")
+        run_num = mcmc_options.pop("run_num", None)
+        num_test_samples = mcmc_options.pop("num_test_samples", 2)
+        vectorized = mcmc_options.pop("vectorized", False)
+        draw_multiple = mcmc_options.pop("draw_multiple", True)
+        ndraw_min = mcmc_options.pop("ndraw_min", 128)
+        ndraw_max = mcmc_options.pop("ndraw_max", 65536)
+        num_bootstraps = mcmc_options.pop("num_bootstraps", 30)
+        warmstart_max_tau = mcmc_options.pop("warmstart_max_tau", -1)
+
+        update_interval_volume_fraction = mcmc_options.pop(
             "update_interval_volume_fraction", 0.8
         )
-        log_interval = mcmc_options.get("log_interval", None)
-        show_status = mcmc_options.get("show_status", True)
-        dlogz = mcmc_options.get("dlogz", 0.5)
-        dKL = mcmc_options.get("dKL", 0.5)
-        frac_remain = mcmc_options.get("frac_remain", 0.1)
-        Lepsilon = mcmc_options.get("Lepsilon", 0.001)
-        min_ess = mcmc_options.get("min_ess", 400)
-        max_iters = mcmc_options.get("max_iters", None)
-        max_ncalls = mcmc_options.get("max_ncalls", None)
-        max_num_improvement_loops = mcmc_options.get("max_num_improvement_loops", -1)
-        min_num_live_points = mcmc_options.get("min_num_live_points", 400)
-        cluster_num_live_points = mcmc_options.get("cluster_num_live_points", 40)
-        insertion_test_zscore_threshold = mcmc_options.get(
+        log_interval = mcmc_options.pop("log_interval", None)
+        show_status = mcmc_options.pop("show_status", True)
+        dlogz = mcmc_options.pop("dlogz", 0.5)
+        dKL = mcmc_options.pop("dKL", 0.5)
+        frac_remain = mcmc_options.pop("frac_remain", 0.1)
+        Lepsilon = mcmc_options.pop("Lepsilon", 0.001)
+        min_ess = mcmc_options.pop("min_ess", 400)
+        max_iters = mcmc_options.pop("max_iters", None)
+        max_ncalls = mcmc_options.pop("max_ncalls", None)
+        max_num_improvement_loops = mcmc_options.pop("max_num_improvement_loops", -1)
+        min_num_live_points = mcmc_options.pop("min_num_live_points", 400)
+        cluster_num_live_points = mcmc_options.pop("cluster_num_live_points", 40)
+        insertion_test_zscore_threshold = mcmc_options.pop(
             "insertion_test_zscore_threshold", 4
         )
-        insertion_test_window = mcmc_options.get("insertion_test_window", 10)
-        region_class = mcmc_options.get("region_class", ultranest.mlfriends.MLFriends)
+        insertion_test_window = mcmc_options.pop("insertion_test_window", 10)
+        region_class = mcmc_options.pop("region_class", ultranest.mlfriends.MLFriends)
 
         # logging setup
         log_level_ultranest = (
@@ -377,6 +696,25 @@ def run_mcmc(
         ultranest_logger.addHandler(logging.NullHandler())
         ultranest_logger.setLevel(log_level_ultranest)
 
+    # All sampler-specific options have been popped by now, so anything left over is
+    # either meant for the sampler_cls, or not used at all. A custom sampler_cls may
+    # accept any of these names, so it is left to reject them itself.
+    if use_multinest or use_zeus or use_ultranest:
+        if mcmc_options:
+            logger.warning(
+                "Ignoring options not used by the chosen sampler: "
+                + ", ".join(mcmc_options)
+            )
+    elif sampler_cls is CosmoHammerSampler:
+        misplaced = mcmc_options.keys() & (
+            _MULTINEST_KEYS | _ZEUS_KEYS | _ULTRANEST_KEYS
+        )
+        if misplaced:
+            raise ValueError(
+                "The options {} are only used by the MultiNest, zeus or UltraNest "
+                "samplers.".format(", ".join(sorted(misplaced)))
+            )
+
     # Setup parameters.
     if not isinstance(params, Params):
         params = Params(*[(k, v) for k, v in params.items()])
@@ -385,12 +723,56 @@ def run_mcmc(
         core_modules, likelihood_modules, params, setup=False
     )
 
+    # Whether the files written by a previous run already hold exactly this chain.
+    up_to_date = False
     if continue_sampling and not (use_multinest or use_zeus or use_ultranest):
+        # We need to ensure that simulate=False if trying to continue sampling. This is
+        # done first, so that the chain can match the one written by a previous run.
+        for lk in chain.getLikelihoodModules():
+            if hasattr(lk, "_simulate") and lk._simulate:
+                logger.warning(
+                    f"Likelihood {lk} was defined to re-simulate data/noise, but this is incompatible with"
+                    "`continue_sampling`. Setting simulate=False and continuing..."
+                )
+                lk._simulate = False
+
         try:
-            with open(file_prefix + ".LCC.yml") as f:
-                old_chain = yaml.load(f)
+            with open(file_prefix + ".LCC.sha256") as f:
+                fingerprint = f.read().strip()
+        except FileNotFoundError:
+            fingerprint = None
+
+        if fingerprint is not None and fingerprint == _chain_fingerprint(chain):
+            # Byte-for-byte the chain that was written (with simulate=False), so there
+            # is no need to load, or write, anything.
+            up_to_date = True
+        else:
+            old_chain = None
+            try:
+                with open(file_prefix + ".LCC.yml") as f:
+                    old_meta = load_yaml(f)
+            except FileNotFoundError:
+                # nothing has been written yet, so there is nothing to continue from.
+                old_meta = None
+
+            if isinstance(old_meta, LikelihoodComputationChain):
+                # written by an older version, which stored the full chain as YAML.
+                old_chain = old_meta
+            elif old_meta is not None and old_meta == _chain_metadata(chain):
+                # only unpickle the full chain if the parameters already match.
+                try:
+                    with open(file_prefix + ".LCC.pkl", "rb") as f:
+                        old_chain = pickle.load(f)
+                except FileNotFoundError:
+                    raise RuntimeError(
+                        "Attempting to continue chain, but {file_prefix}.LCC.pkl is "
+                        "missing, so the chain can't be checked against it. Set "
+                        "continue_sampling=False to start afresh.".format(
+                            file_prefix=file_prefix
+                        )
+                    )
 
-            if old_chain != chain:
+            if old_meta is not None and old_chain != chain:
                 raise RuntimeError(
                     "Attempting to continue chain, but chain parameters are different. "
                     + "Check your parameters against {file_prefix}.LCC.yml".format(
@@ -398,48 +780,51 @@ def run_mcmc(
                     )
                 )
 
-        except FileNotFoundError:
-            pass
-
-        # We need to ensure that simulate=False if trying to continue sampling.
-        for lk in chain.getLikelihoodModules():
-            if hasattr(lk, "_simulate") and lk._simulate:
-                logger.warning(
-                    f"Likelihood {lk} was defined to re-simulate data/noise, but this is incompatible with"
-                    "`continue_sampling`. Setting simulate=False and continuing..."
-                )
-                lk._simulate = False
-    # Write out the parameters *before* setup.
+    # Write out the chain *before* setup: the full object is pickled, and its
+    # parameters are written to a human-readable YAML file next to it, along with
+    # a fingerprint of the pickle for cheap comparison on continuation. Unless the
+    # fingerprint matched, the files are (re-)written, so that continuing an equal
+    # chain (eg. from an older version's files) takes the fast path next time.
     # TODO: not sure if this is the best idea -- should it be after setup()?
-    try:
-        with open(file_prefix + ".LCC.yml", "w") as f:
-            yaml.dump(chain, f)
-    except Exception as e:
-        logger.warning(
-            "Attempt to write out YAML file containing LikelihoodComputationChain failed. "
-            "Boldly continuing..."
-        )
-        print(e)
+    if not up_to_date:
+        try:
+            chain_bytes = pickle.dumps(chain, protocol=5)
+            with open(file_prefix + ".LCC.pkl", "wb") as f:
+                f.write(chain_bytes)
+            with open(file_prefix + ".LCC.yml", "w") as f:
+                dump_yaml(_chain_metadata(chain), f)
+            with open(file_prefix + ".LCC.sha256", "w") as f:
+                f.write(hashlib.sha256(chain_bytes).hexdigest())
+        except Exception as e:
+            logger.warning(
+                "Attempt to write out LikelihoodComputationChain failed (%s). "
+                "Boldly continuing...",
+                e,
+            )
 
     chain.setup()
     # Set logging levels
     if log_level_21CMMC is not None:
         logging.getLogger("21CMMC").setLevel(log_level_21CMMC)
+
     if use_multinest:
+        to_physical, _ = _prior_kernels()
+        lower = params[:, 1].astype(np.float64)
+        width = params[:, 2] - lower
 
         def likelihood(p, ndim, nparams):
             try:
                 return chain.computeLikelihoods(
-                    chain.build_model_data(
-                        Params(*[(k, v) for k, v in zip(params.keys, p)])
-                    )
+                    chain.build_model_data(np.array(p[:ndim]))
                 )
             except ParameterError:
                 return -np.inf
 
         def prior(p, ndim, nparams):
-            for i in range(ndim):
-                p[i] = params[i][1] + p[i] * (params[i][2] - params[i][1])
+            # map the unit cube onto the parameter ranges in-place in MultiNest's buffer
+            to_physical(
+                np.ctypeslib.as_array(p, shape=(ndim,)), lower[:ndim], width[:ndim]
+            )
 
         try:
             sampler = run(
@@ -466,31 +851,13 @@ def run_mcmc(
             )
 
     elif use_zeus:
-
-        def prior(p):
-            for i, value in enumerate(p):
-                if (value > params[i][2]) or (value < params[i][1]):
-                    return p, True
-            return p, False
-
-        def likelihood(p):
-            try:
-                return chain.computeLikelihoods(
-                    chain.build_model_data(
-                        Params(*[(k, v) for k, v in zip(params.keys, p)])
-                    )
-                )
-            except ParameterError:
-                return -np.inf
-
-        def posterior(p):
-            # pass point into prior to check if in bounds
-            p, inf = prior(p)
-            if inf:
-                return -np.inf
-            # if in bounds, evaluate likelihood
-            log_prob = likelihood(p)
-            return log_prob
+        posterior = _ZeusPosterior(
+            chain,
+            lower=params[:ndim, 1],
+            upper=params[:ndim, 2],
+            distribute=map if pool is None else _batched_pool(pool, nwalkers).map,
+            cache_size=likelihood_cache_size,
+        )
 
         sampler = zeus.EnsembleSampler(
             nwalkers,
@@ -501,8 +868,7 @@ def run_mcmc(
             maxsteps=maxsteps,
             mu=mu,
             maxiter=maxiter,
-            pool=pool,
-            vectorize=vectorize,
+            vectorize=True,
             blobs_dtype=blobs_dtype,
             verbose=verbose,
             check_walkers=check_walkers,
@@ -516,18 +882,10 @@ def run_mcmc(
 
         def likelihood(p):
             if vectorized:
-                return chain.computeLikelihoods(
-                    chain.build_model_data(
-                        Params(*[(k, v) for k, v in zip(params.keys, p.T)])
-                    )
-                )
+                return chain.computeLikelihoods(chain.build_model_data(p.T))
             else:
                 try:
-                    return chain.computeLikelihoods(
-                        chain.build_model_data(
-                            Params(*[(k, v) for k, v in zip(params.keys, p)])
-                        )
-                    )
+                    return chain.computeLikelihoods(chain.build_model_data(p))
                 except ParameterError:
                     return -np.inf
 
@@ -577,21 +935,36 @@ def run_mcmc(
         return sampler, result
 
     else:
-        pool = mcmc_options.pop(
-            "pool",
-            ProcessPoolExecutor(max_workers=mcmc_options.get("threadCount", 1)),
-        )
-        sampler = sampler_cls(
-            continue_sampling=continue_sampling,
-            likelihoodComputationChain=chain,
-            storageUtil=HDFStorageUtil(file_prefix),
-            filePrefix=file_prefix,
-            reuseBurnin=reuse_burnin,
-            pool=pool,
-            **mcmc_options,
-        )
+        # Only use our own pool if the user hasn't supplied one.
+        pool = mcmc_options.pop("pool", None)
+        own_pool = pool is None
+        if own_pool:
+            pool = _get_default_pool(
+                mcmc_options.get("threadCount", 1), log_level_21CMMC, start_method
+            )
+
+        try:
+            sampler = sampler_cls(
+                continue_sampling=continue_sampling,
+                likelihoodComputationChain=chain,
+                storageUtil=HDFStorageUtil(
+                    file_prefix,
+                    chunk_rows=storage_chunk_rows,
+                    compression=storage_compression,
+                    shuffle=storage_compression is not None,
+                ),
+                filePrefix=file_prefix,
+                reuseBurnin=reuse_burnin,
+                pool=pool,
+                **mcmc_options,
+            )
 
-        # The sampler writes to file, so no need to save anything ourselves.
-        sampler.startSampling()
+            # The sampler writes to file, so no need to save anything ourselves.
+            sampler.startSampling()
+        except BaseException:
+            # The failure may have left the pool broken or busy, so start afresh next time.
+            if own_pool:
+                _shutdown_default_pool()
+            raise
 
         return sampler
@@ -1,14 +1,20 @@
 import pytest
 
 import logging
+import multiprocessing
 import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from py21cmfast import LightCone
+from py21cmfast import LightCone, yaml
+from scipy.stats import truncnorm
 
 import py21cmmc as mcmc
+from py21cmmc import mcmc as mcmc_module
 from py21cmmc.cosmoHammer import (
     CosmoHammerSampler,
+    HDFStorage,
     HDFStorageUtil,
     LikelihoodComputationChain,
     Params,
@@ -181,6 +187,186 @@ def test_mcmc(core, likelihood_coeval, default_params, tmpdirec):
     assert samples_from_chain.param_guess["ION_Tvir_MIN"] == 4.7
 
 
+def test_mcmc_default_pool(core, likelihood_coeval, default_params, tmpdirec):
+    kwargs = dict(
+        model_name="TESTPOOL",
+        continue_sampling=False,
+        datadir=str(tmpdirec),
+        params=default_params,
+        walkersRatio=2,
+        burninIterations=0,
+        sampleIterations=1,
+        threadCount=2,
+    )
+    chain = mcmc.run_mcmc(core, likelihood_coeval, **kwargs)
+    assert mcmc.get_samples(chain).iteration == 1
+
+    # the pool uses the platform's default start method, so cores and likelihoods
+    # defined in __main__ can still be used.
+    pool = mcmc_module._default_pool
+    assert pool._max_workers == 2
+    assert pool._mp_context.get_start_method() == multiprocessing.get_start_method()
+
+    # and it is re-used by the next call with the same options.
+    mcmc.run_mcmc(core, likelihood_coeval, **kwargs)
+    assert mcmc_module._default_pool is pool
+
+
+def test_misplaced_options(core, likelihood_coeval, default_params, tmpdirec):
+    with pytest.raises(ValueError, match="nsteps"):
+        mcmc.run_mcmc(
+            core,
+            likelihood_coeval,
+            model_name="TESTOPTIONS",
+            continue_sampling=False,
+            datadir=str(tmpdirec),
+            params=default_params,
+            walkersRatio=2,
+            burninIterations=0,
+            sampleIterations=1,
+            threadCount=1,
+            nsteps=10,
+        )
+
+
+def test_custom_sampler_options(core, likelihood_coeval, default_params, tmpdirec):
+    class SeededSampler(CosmoHammerSampler):
+        def __init__(self, *args, seed=None, **kwargs):
+            self.seed = seed
+            super().__init__(*args, **kwargs)
+
+    # a custom sampler may take options that share a name with those of zeus.
+    sampler = mcmc.run_mcmc(
+        core,
+        likelihood_coeval,
+        model_name="TESTOPTIONS",
+        continue_sampling=False,
+        datadir=str(tmpdirec),
+        params=default_params,
+        sampler_cls=SeededSampler,
+        walkersRatio=2,
+        burninIterations=0,
+        sampleIterations=1,
+        threadCount=1,
+        seed=1234,
+    )
+    assert sampler.seed == 1234
+
+
+def test_ignored_options(core, likelihood_coeval, default_params, tmpdirec, caplog):
+    mcmc.run_mcmc(
+        core,
+        likelihood_coeval,
+        model_name="TESTOPTIONS",
+        continue_sampling=False,
+        datadir=str(tmpdirec),
+        params=default_params,
+        use_zeus=True,
+        nwalkers=4,
+        nsteps=1,
+        walkersRatio=2,
+    )
+    assert (
+        "Ignoring options not used by the chosen sampler: walkersRatio" in caplog.text
+    )
+
+
+def _square(x):
+    return x * x
+
+
+class _SerialPool:
+    def map(self, fn, iterable):
+        return map(fn, iterable)
+
+
+def test_batched_pool():
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        batched = mcmc_module._batched_pool(pool, 16)
+        assert batched._chunksize == 2
+        assert list(batched.map(_square, range(16))) == [x * x for x in range(16)]
+
+    with ThreadPool(4) as pool:
+        batched = mcmc_module._batched_pool(pool, 10)
+        assert batched._chunksize == 1
+        assert list(batched.map(_square, range(10))) == [x * x for x in range(10)]
+
+
+def test_batched_pool_without_chunksize():
+    pool = _SerialPool()
+    assert mcmc_module._batched_pool(pool, 16) is pool
+
+
+class _StubChain:
+    """A chain whose likelihood is -|p|^2, counting the evaluated points."""
+
+    def __init__(self, change_seed_every_iter=False):
+        self.evaluated = []
+        self.core = mcmc.CoreCoevalModule(
+            redshift=9, change_seed_every_iter=change_seed_every_iter
+        )
+
+    def getCoreModules(self):
+        return [self.core]
+
+    def build_model_data(self, p):
+        self.evaluated.append(tuple(p))
+        return p
+
+    def computeLikelihoods(self, p):
+        return -np.sum(np.square(p))
+
+
+@pytest.mark.parametrize("cache_size", [0, 4096])
+def test_zeus_posterior(cache_size):
+    chain = _StubChain()
+    posterior = mcmc_module._ZeusPosterior(chain, [0, 0], [1, 1], cache_size=cache_size)
+
+    P = np.array([[0.3, 0.4], [1.5, 0.5], [0.1, 0.2], [0.5, -0.1], [0.0, 1.0]])
+    log_prob = posterior(P)
+
+    # out-of-bounds walkers are rejected without evaluating the likelihood.
+    assert np.all(np.isinf(log_prob[[1, 3]]))
+    assert chain.evaluated == [(0.3, 0.4), (0.1, 0.2), (0.0, 1.0)]
+    assert np.allclose(log_prob[[0, 2, 4]], [-0.25, -0.05, -1.0])
+
+    log_prob = posterior(np.array([[2.0, 2.0], [-1.0, 0.5]]))
+    assert np.all(log_prob == -np.inf)
+    assert len(chain.evaluated) == 3
+
+
+def test_zeus_posterior_cache():
+    chain = _StubChain()
+    posterior = mcmc_module._ZeusPosterior(chain, [0, 0], [1, 1], cache_size=2)
+
+    P = np.array([[0.1, 0.2], [0.3, 0.4], [0.1, 0.2]])
+    assert np.allclose(posterior(P), [-0.05, -0.25, -0.05])
+    # the repeated point is only evaluated once...
+    assert chain.evaluated == [(0.1, 0.2), (0.3, 0.4)]
+
+    # ...and not at all when it is proposed again.
+    assert np.allclose(posterior(P[:1]), [-0.05])
+    assert len(chain.evaluated) == 2
+
+    # only the most recent points are remembered.
+    posterior(np.array([[0.5, 0.5]]))
+    posterior(P[:1])
+    assert len(chain.evaluated) == 4
+
+
+@pytest.mark.parametrize(
+    "cache_size,change_seed_every_iter", [(0, False), (4096, True)]
+)
+def test_zeus_posterior_no_cache(cache_size, change_seed_every_iter):
+    chain = _StubChain(change_seed_every_iter)
+    posterior = mcmc_module._ZeusPosterior(chain, [0, 0], [1, 1], cache_size=cache_size)
+
+    P = np.array([[0.1, 0.2], [0.1, 0.2]])
+    posterior(P)
+    posterior(P)
+    assert len(chain.evaluated) == 4
+
+
 def test_continue_burnin(core, likelihood_coeval, default_params, tmpdirec):
     with pytest.raises(AssertionError):  # needs to be sampled for at least 1 iteration!
         mcmc.run_mcmc(
@@ -319,6 +505,334 @@ def test_bad_continuation(core, likelihood_coeval, default_params, tmpdirec):
             threadCount=1,
         )
 
+    # We set the _simulate back to True to have no side-effects.
+    likelihood_coeval._simulate = True
+
+
+def test_continue_legacy_yaml(core, likelihood_coeval, default_params, tmpdirec, cache):
+    "check that chains written by older versions, stored in full as YAML, are continued"
+    kwargs = dict(
+        model_name="TESTLEGACY",
+        datadir=tmpdirec,
+        params=default_params,
+        walkersRatio=2,
+        burninIterations=0,
+        threadCount=1,
+    )
+    mcmc.run_mcmc(
+        core, likelihood_coeval, continue_sampling=False, sampleIterations=1, **kwargs
+    )
+
+    legacy = mcmc.build_computation_chain(
+        mcmc.CoreCoevalModule(
+            redshift=9,
+            user_params={"HII_DIM": 35, "DIM": 70},
+            cache_mcmc=False,
+            cache_dir=str(cache),
+        ),
+        mcmc.Likelihood1DPowerCoeval(
+            simulate=True, datafile=str(tmpdirec / "likelihood_coeval.npz")
+        ),
+        Params(*default_params.items()),
+        setup=False,
+    )
+    os.remove(tmpdirec / "TESTLEGACY.LCC.pkl")
+    os.remove(tmpdirec / "TESTLEGACY.LCC.sha256")
+    with open(tmpdirec / "TESTLEGACY.LCC.yml", "w") as f:
+        yaml.dump(legacy, f)
+
+    lcc = mcmc.load_primitive_chain("TESTLEGACY", direc=tmpdirec)
+    assert lcc.getCoreModules()[0].redshift == core.redshift
+
+    chain = mcmc.run_mcmc(
+        core, likelihood_coeval, continue_sampling=True, sampleIterations=2, **kwargs
+    )
+    assert chain.samples.iteration == 2
+
+    # the chain is written out again in the current format.
+    assert (tmpdirec / "TESTLEGACY.LCC.pkl").exists()
+
+    # We set the _simulate back to True to have no side-effects.
+    likelihood_coeval._simulate = True
+
+
+def test_continue_legacy_yaml_no_simulate(default_params, tmpdirec, cache, monkeypatch):
+    "check that an older version's chain is moved to the current format on continuation"
+
+    def modules(simulate):
+        return (
+            mcmc.CoreCoevalModule(
+                redshift=9,
+                user_params={"HII_DIM": 35, "DIM": 70},
+                cache_mcmc=False,
+                cache_dir=str(cache),
+            ),
+            mcmc.Likelihood1DPowerCoeval(
+                simulate=simulate, datafile=str(tmpdirec / "likelihood_legacy.npz")
+            ),
+        )
+
+    kwargs = dict(
+        model_name="TESTLEGACYNOSIM",
+        datadir=tmpdirec,
+        params=default_params,
+        walkersRatio=2,
+        burninIterations=0,
+        threadCount=1,
+    )
+    mcmc.run_mcmc(
+        *modules(simulate=True), continue_sampling=False, sampleIterations=1, **kwargs
+    )
+
+    # an older version's files, for a likelihood that reads its data from file.
+    legacy = mcmc.build_computation_chain(
+        *modules(simulate=False), Params(*default_params.items()), setup=False
+    )
+    os.remove(tmpdirec / "TESTLEGACYNOSIM.LCC.pkl")
+    os.remove(tmpdirec / "TESTLEGACYNOSIM.LCC.sha256")
+    with open(tmpdirec / "TESTLEGACYNOSIM.LCC.yml", "w") as f:
+        yaml.dump(legacy, f)
+
+    mcmc.run_mcmc(
+        *modules(simulate=False), continue_sampling=True, sampleIterations=2, **kwargs
+    )
+    assert (tmpdirec / "TESTLEGACYNOSIM.LCC.pkl").exists()
+    assert (tmpdirec / "TESTLEGACYNOSIM.LCC.sha256").exists()
+
+    # so the next continuation doesn't need to load the previous chain.
+    def load_yaml(stream):
+        raise AssertionError("the previous chain should not have been loaded")
+
+    monkeypatch.setattr(mcmc_module, "load_yaml", load_yaml)
+    sampler = mcmc.run_mcmc(
+        *modules(simulate=False), continue_sampling=True, sampleIterations=3, **kwargs
+    )
+    assert sampler.samples.iteration == 3
+
+
+def test_continue_different_params(core, likelihood_coeval, default_params, tmpdirec):
+    "check that parameters differing from the YAML file raise without unpickling"
+    kwargs = dict(
+        model_name="TESTMETADATA",
+        datadir=tmpdirec,
+        walkersRatio=2,
+        burninIterations=0,
+        sampleIterations=1,
+        threadCount=1,
+    )
+    mcmc.run_mcmc(
+        core,
+        likelihood_coeval,
+        continue_sampling=False,
+        params=default_params,
+        **kwargs,
+    )
+
+    # if the parameters differ, the pickled chain should never be needed.
+    os.remove(tmpdirec / "TESTMETADATA.LCC.pkl")
+
+    with pytest.raises(RuntimeError, match="chain parameters are different"):
+        mcmc.run_mcmc(
+            core,
+            likelihood_coeval,
+            continue_sampling=True,
+            params=dict(default_params, HII_EFF_FACTOR=[30.0, 20.0, 40.0, 3.0]),
+            **kwargs,
+        )
+
+    # We set the _simulate back to True to have no side-effects.
+    likelihood_coeval._simulate = True
+
+
+def test_continue_missing_pickle(core, likelihood_coeval, default_params, tmpdirec):
+    "check that a chain which can't be checked against the previous one raises"
+    kwargs = dict(
+        model_name="TESTMISSINGPKL",
+        datadir=tmpdirec,
+        params=default_params,
+        walkersRatio=2,
+        burninIterations=0,
+        sampleIterations=1,
+        threadCount=1,
+    )
+    mcmc.run_mcmc(core, likelihood_coeval, continue_sampling=False, **kwargs)
+
+    os.remove(tmpdirec / "TESTMISSINGPKL.LCC.pkl")
+    os.remove(tmpdirec / "TESTMISSINGPKL.LCC.sha256")
+
+    with pytest.raises(RuntimeError, match="LCC.pkl is missing"):
+        mcmc.run_mcmc(core, likelihood_coeval, continue_sampling=True, **kwargs)
+
+    # and the existing files are left alone.
+    assert not (tmpdirec / "TESTMISSINGPKL.LCC.pkl").exists()
+
+    # We set the _simulate back to True to have no side-effects.
+    likelihood_coeval._simulate = True
+
+
+def test_continue_unchanged_chain(default_params, tmpdirec, cache, monkeypatch):
+    "check that continuing an unchanged chain doesn't load the previous one"
+
+    def run(redshift=9, **kwargs):
+        return mcmc.run_mcmc(
+            mcmc.CoreCoevalModule(
+                redshift=redshift,
+                user_params={"HII_DIM": 35, "DIM": 70},
+                cache_mcmc=False,
+                cache_dir=str(cache),
+            ),
+            mcmc.Likelihood1DPowerCoeval(
+                simulate=True, datafile=str(tmpdirec / "likelihood_unchanged.npz")
+            ),
+            model_name="TESTUNCHANGED",
+            datadir=tmpdirec,
+            params=default_params,
+            walkersRatio=2,
+            burninIterations=0,
+            threadCount=1,
+            **kwargs,
+        )
+
+    run(continue_sampling=False, sampleIterations=1)
+
+    # the first continuation sets simulate=False, so it writes the chain out again.
+    run(continue_sampling=True, sampleIterations=2)
+    mtime = os.path.getmtime(tmpdirec / "TESTUNCHANGED.LCC.pkl")
+
+    def load_yaml(stream):
+        raise AssertionError("the previous chain should not have been loaded")
+
+    monkeypatch.setattr(mcmc_module, "load_yaml", load_yaml)
+    sampler = run(continue_sampling=True, sampleIterations=3)
+    assert sampler.samples.iteration == 3
+
+    # and nothing needs to be written out again.
+    assert os.path.getmtime(tmpdirec / "TESTUNCHANGED.LCC.pkl") == mtime
+
+    monkeypatch.undo()
+    with pytest.raises(RuntimeError):
+        run(redshift=8, continue_sampling=True, sampleIterations=4)
+
+
+def test_params_from_vector():
+    keys = ("HII_EFF_FACTOR", "ION_Tvir_MIN")
+    values = np.array([30.0, 4.7])
+    params = Params.from_vector(keys, values)
+
+    assert params.keys == list(keys)
+    assert params.HII_EFF_FACTOR == 30.0
+
+    # values are copied, so the input can be re-used.
+    values[0] = 40.0
+    assert params.HII_EFF_FACTOR == 30.0
+
+    # zeus and MultiNest may sample only the first ndim parameters.
+    params = Params.from_vector(keys + ("L_X",), values[:2])
+    assert params.keys == list(keys)
+    assert np.all(params.values == [40.0, 4.7])
+
+
+def test_hdf_storage_chunked(tmpdirec):
+    storage = HDFStorage(
+        str(tmpdirec / "chunked.h5"),
+        name="sample_chain",
+        chunk_rows=8,
+        compression="gzip",
+        shuffle=True,
+    )
+    # small enough that the chunks of the blobs have to be clamped.
+    storage.chunk_cache_bytes = 1 << 14
+
+    params = Params(
+        ("HII_EFF_FACTOR", [30.0, 10.0, 50.0, 3.0]), ("ION_Tvir_MIN", [4.7, 2, 8, 0.1])
+    )
+    nwalkers, niter = 4, 3
+    storage.reset(nwalkers, params)
+
+    rng = np.random.default_rng(1234)
+    coords = rng.random((niter, nwalkers, 2))
+    log_prob = rng.random((niter, nwalkers))
+    power = rng.random((niter, nwalkers, 100))
+    blobs = [[{"power": power[i, j]} for j in range(nwalkers)] for i in range(niter)]
+
+    storage.grow(niter, blobs[0][0])
+    for i in range(niter):
+        storage.save_step(
+            coords[i],
+            log_prob[i],
+            blobs[i],
+            truepos=coords[i],
+            trueprob=log_prob[i],
+            accepted=np.ones(nwalkers, dtype=bool),
+            random_state=np.random.get_state(),
+        )
+
+    with storage.open() as f:
+        g = f["sample_chain"]
+        assert g["chain"].chunks == (8, nwalkers, 2)
+        assert g["chain"].compression == "gzip"
+        # 100 float64's per walker: only 5 iterations fit in the chunk cache.
+        assert g["blobs"].chunks == (5, nwalkers)
+        assert g["blobs"].compression == "gzip"
+
+    assert storage.iteration == niter
+    assert np.all(storage.get_chain() == coords)
+    assert np.all(storage.get_log_prob() == log_prob)
+    assert np.all(storage.get_blobs()["power"] == power)
+
+
+def test_prior_kernels():
+    lower = np.array([0.0, -1.0, 10.0])
+    upper = np.array([1.0, 1.0, 20.0])
+    width = upper - lower
+
+    rng = np.random.default_rng(42)
+    # non-contiguous views of points in and around the bounds, with a NaN in each.
+    points = np.empty((20, 6))
+    points[::2, ::2] = lower + width * rng.uniform(-0.3, 1.3, size=(10, 3))
+    points[6, 2] = np.nan
+    cube = np.empty(6)
+    cube[::2] = rng.random(3)
+    cube[2] = np.nan
+
+    results = []
+    for to_physical, out_of_bounds in [
+        (mcmc_module._to_physical, mcmc_module._out_of_bounds),
+        (mcmc_module._to_physical_loop, mcmc_module._out_of_bounds_loop),
+        # compiled with numba, if it is installed.
+        mcmc_module._prior_kernels.__wrapped__(),
+    ]:
+        physical = cube.copy()[::2]
+        to_physical(physical, lower, width)
+        results.append((physical, out_of_bounds(points[::2, ::2], lower, upper)))
+
+    physical, outside = results[0]
+    assert np.isnan(physical[1])
+    assert np.all(
+        (physical[[0, 2]] >= lower[[0, 2]]) & (physical[[0, 2]] <= upper[[0, 2]])
+    )
+    assert 0 < np.sum(outside) < len(outside)
+
+    for other_physical, other_outside in results[1:]:
+        np.testing.assert_array_equal(other_physical, physical)
+        np.testing.assert_array_equal(other_outside, outside)
+
+
+@pytest.mark.parametrize(
+    "a,b", [(-np.inf, 1.0), (0.5, np.inf), (3.0, 5.0), (8.0, 9.0), (-2.0, 1.5)]
+)
+def test_truncated_normal(a, b):
+    n = 100000
+    x = mcmc_module._truncated_normal(
+        np.array(a), np.array(b), size=n, rng=np.random.default_rng(1234)
+    )
+
+    assert np.all((x >= a) & (x <= b))
+
+    mean, var = truncnorm.stats(a, b, moments="mv")
+    assert np.abs(x.mean() - mean) < 5 * np.sqrt(var / n)
+    assert np.isclose(x.std(), np.sqrt(var), rtol=0.02)
+
 
 def test_init_pos_generator_good(core, likelihood_coeval, tmpdirec):
     params = Params(